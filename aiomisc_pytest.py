@@ -7,16 +7,18 @@ import platform
 import socket
 import sys
 import warnings
+import weakref
 from asyncio.events import get_event_loop
+from collections import deque
 from contextlib import contextmanager, suppress
 from functools import partial, wraps
 from inspect import isasyncgenfunction
+from itertools import chain
 from types import ModuleType
 from typing import (
-    Any, AsyncGenerator, Awaitable, Callable, Dict, Generator, Iterable, List,
-    Mapping, NamedTuple, Optional, Set, Tuple, Type, Union,
+    Any, AsyncGenerator, Awaitable, Callable, Coroutine, Deque, Dict, Generator,
+    Iterable, List, Mapping, NamedTuple, Optional, Tuple, Type, Union, cast,
 )
-from unittest.mock import MagicMock
 
 import aiomisc
 import pytest
@@ -44,67 +46,437 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 ProxyProcessorType = Callable[[bytes], Awaitable[bytes]]
+ChunkType = Union[bytes, memoryview]
+TCP_CORK: Optional[int] = getattr(socket, "TCP_CORK", None)
+
+
+def sock_set_cork(sock: Optional[socket.socket], value: bool) -> None:
+    if sock is None or TCP_CORK is None:
+        return
+    with suppress(OSError):
+        sock.setsockopt(socket.IPPROTO_TCP, TCP_CORK, int(value))
 
 
 class Delay:
-    __slots__ = "__timeout", "future", "lock"
+    __slots__ = "_timeout", "future"
 
     def __init__(self) -> None:
-        self.__timeout: Union[int, float] = 0
-        self.future: Optional[asyncio.Future] = None
-        self.lock = asyncio.Lock()
+        self._timeout: Union[int, float] = 0
+        self.future: Optional["asyncio.Future[bool]"] = None
 
     @property
     def timeout(self) -> Union[int, float]:
-        return self.__timeout
+        return self._timeout
 
     @timeout.setter
     def timeout(self, value: TimeoutType) -> None:
         assert isinstance(value, (int, float))
         assert value >= 0
 
-        self.__timeout = value
+        self._timeout = value
 
         if self.future and not self.future.done():
             self.future.set_result(True)
 
     async def wait(self) -> None:
-        if self.__timeout == 0:
+        timeout = self._timeout
+        if not timeout:
             return
 
-        async with self.lock:
-            try:
-                self.future = delayed_future(self.__timeout)
-                await self.future
-            finally:
-                self.future = None
+        # Each delay belongs to a single pipe direction and is never
+        # awaited concurrently, the future is kept only to be resolved
+        # early when the timeout is changed.
+        self.future = delayed_future(timeout)
+        try:
+            await self.future
+        finally:
+            self.future = None
 
 
 def delayed_future(
     timeout: Union[int, float], result: bool = True,
-) -> asyncio.Future:
+) -> "asyncio.Future[bool]":
 
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
 
-    def resolve(f: asyncio.Future) -> None:
+    def resolve(f: "asyncio.Future[bool]") -> None:
         nonlocal result
 
         if f.done():
             return
         f.set_result(result)
 
-    future = loop.create_future()
+    future: "asyncio.Future[bool]" = loop.create_future()
     handle = loop.call_later(timeout, resolve, future)
     future.add_done_callback(lambda _: handle.cancel())
 
     return future
 
 
+class BufferPool:
+    """ Free lists of read buffers shared by the proxy clients, one list
+    per power of two size. Holds no more idle buffers than there are
+    active readers. """
+
+    __slots__ = "buffers", "idle", "readers"
+
+    def __init__(self) -> None:
+        self.buffers: Dict[int, Deque[bytearray]] = {}
+        self.idle = 0
+        self.readers = 0
+
+    @staticmethod
+    def size_class(size: int) -> int:
+        return 1 << max(size - 1, 0).bit_length()
+
+    def acquire(self, size: int) -> bytearray:
+        size = self.size_class(size)
+        buffers = self.buffers.get(size)
+        if not buffers:
+            return bytearray(size)
+        self.idle -= 1
+        return buffers.pop()
+
+    def release(self, buffer: bytearray) -> None:
+        size = len(buffer)
+        if self.idle >= self.readers or size != self.size_class(size):
+            return
+        self.buffers.setdefault(size, deque()).append(buffer)
+        self.idle += 1
+
+    def trim(self) -> None:
+        # The largest idle buffers are dropped first
+        for size in sorted(self.buffers, reverse=True):
+            buffers = self.buffers[size]
+            while buffers and self.idle > self.readers:
+                buffers.popleft()
+                self.idle -= 1
+            if not buffers:
+                del self.buffers[size]
+
+    @contextmanager
+    def reader(self) -> Generator[None, None, None]:
+        self.readers += 1
+        try:
+            yield
+        finally:
+            self.readers -= 1
+            self.trim()
+
+
+BUFFER_POOL = BufferPool()
+
+
+class ProxyProtocol(asyncio.BufferedProtocol):
+    """ Proxy side of a connection. Incoming data is received straight
+    into pooled buffers which are handed over to the reader as is, so
+    the data is not copied on the way through the proxy. The writing
+    side mimics the asyncio.StreamWriter methods the proxy needs. """
+
+    transport: asyncio.Transport
+
+    def __init__(
+        self, buffer_size: int,
+        connected_cb: Optional[
+            Callable[["ProxyProtocol"], Coroutine[Any, Any, None]]
+        ] = None,
+    ):
+        self.loop = asyncio.get_running_loop()
+        self.buffer_size = buffer_size
+        self.read_limit = min(TCPProxyClient.MIN_CHUNK_SIZE, buffer_size)
+        self.buffer: Optional[bytearray] = None
+        self.size = 0
+        self.eof = False
+        self.exception: Optional[BaseException] = None
+        self.reading_paused = False
+        self.writing_paused = False
+        self.read_waiter: Optional["asyncio.Future[None]"] = None
+        self.drain_waiters: Deque["asyncio.Future[None]"] = deque()
+        self.closed: "asyncio.Future[None]" = self.loop.create_future()
+        self.connected_cb = connected_cb
+        self.connected_task: Optional["asyncio.Task[None]"] = None
+        self.streams: Optional[
+            Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+        ] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = cast(asyncio.Transport, transport)
+        if self.connected_cb is not None:
+            self.connected_task = self.loop.create_task(
+                self.connected_cb(self),
+            )
+            self.connected_task.add_done_callback(self._on_connected_done)
+
+    def _on_connected_done(self, task: "asyncio.Task[None]") -> None:
+        # Same as asyncio.StreamReaderProtocol does, otherwise the peer
+        # would hang forever when the callback fails, e.g. when the proxy
+        # target is unreachable
+        if task.cancelled():
+            self.transport.close()
+            return
+
+        exc = task.exception()
+        if exc is None:
+            return
+
+        self.loop.call_exception_handler({
+            "message": "Unhandled exception in connected_cb",
+            "exception": exc,
+            "transport": self.transport,
+            "protocol": self,
+        })
+        self.transport.close()
+
+    @classmethod
+    def from_streams(
+        cls, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+        buffer_size: int,
+    ) -> "ProxyProtocol":
+        """ Takes over the transport of the stream pair, including the
+        data the reader has already received. The pair is kept for the
+        lifetime of the connection, the StreamWriter would close the
+        transport when it's garbage collected. """
+
+        # noinspection PyProtectedMember
+        pending = reader._buffer        # type: ignore
+        # noinspection PyProtectedMember
+        stream_protocol = writer._protocol  # type: ignore
+
+        transport = cast(asyncio.Transport, writer.transport)
+        protocol = cls(buffer_size)
+        protocol.connection_made(transport)
+        protocol.streams = (reader, writer)
+        transport.set_protocol(protocol)
+
+        # noinspection PyProtectedMember
+        protocol.eof = reader._eof      # type: ignore
+        # noinspection PyProtectedMember
+        protocol.exception = reader._exception  # type: ignore
+        # noinspection PyProtectedMember
+        protocol.writing_paused = stream_protocol._paused
+
+        if pending:
+            protocol.buffer = BUFFER_POOL.acquire(len(pending))
+            protocol.size = len(pending)
+            protocol.buffer[:protocol.size] = pending
+            pending.clear()
+
+        # noinspection PyProtectedMember
+        reading_paused = reader._paused     # type: ignore
+        protocol.reading_paused = protocol.buffer_full
+        if reading_paused and not protocol.reading_paused:
+            transport.resume_reading()
+        elif protocol.reading_paused and not reading_paused:
+            transport.pause_reading()
+
+        return protocol
+
+    def connection_lost(self, exc: Optional[BaseException]) -> None:
+        self.eof = True
+        self.exception = exc
+        self._wakeup_reader()
+
+        while self.drain_waiters:
+            waiter = self.drain_waiters.popleft()
+            if waiter.done():
+                continue
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        # The buffer is sized by the current read limit, so connections
+        # waiting with a little pending data don't pin the whole chunk
+        if self.buffer is None:
+            self.buffer = BUFFER_POOL.acquire(self.read_limit)
+        return memoryview(self.buffer)[self.size:self.read_limit]
+
+    @property
+    def buffer_full(self) -> bool:
+        if self.buffer is None:
+            return False
+        return self.size >= min(self.read_limit, len(self.buffer))
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.size += nbytes
+
+        if self.buffer_full:
+            self.reading_paused = True
+            self.transport.pause_reading()
+
+        self._wakeup_reader()
+
+    def eof_received(self) -> None:
+        self.eof = True
+        self._wakeup_reader()
+
+    def pause_writing(self) -> None:
+        self.writing_paused = True
+
+    def resume_writing(self) -> None:
+        self.writing_paused = False
+
+        while self.drain_waiters:
+            waiter = self.drain_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _wakeup_reader(self) -> None:
+        if self.read_waiter is not None and not self.read_waiter.done():
+            self.read_waiter.set_result(None)
+
+    async def read(self, limit: int) -> Tuple[Optional[bytearray], int]:
+        """ Returns the filled buffer and the amount of the received bytes
+        in it, buffer is None on EOF. The buffer is owned by the caller,
+        which should return it to the BUFFER_POOL when it is done. """
+
+        self.read_limit = min(limit, self.buffer_size)
+
+        while not self.size:
+            if self.exception is not None:
+                raise self.exception
+
+            if self.eof:
+                if self.buffer is not None:
+                    BUFFER_POOL.release(self.buffer)
+                    self.buffer = None
+                return None, 0
+
+            self.read_waiter = self.loop.create_future()
+            try:
+                await self.read_waiter
+            finally:
+                self.read_waiter = None
+
+        buffer, size = self.buffer, self.size
+        self.buffer, self.size = None, 0
+
+        if self.reading_paused and not self.eof:
+            self.reading_paused = False
+            self.transport.resume_reading()
+
+        return buffer, size
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        return self.transport.get_extra_info(name, default)
+
+    def write(self, data: ChunkType) -> None:
+        self.transport.write(data)
+
+    def writelines(self, data: Iterable[ChunkType]) -> None:
+        self.transport.writelines(data)
+
+    async def drain(self) -> None:
+        if self.transport.is_closing():
+            # Let connection_lost to be called
+            await asyncio.sleep(0)
+
+        if self.closed.done():
+            raise ConnectionResetError("Connection lost")
+
+        if not self.writing_paused:
+            return
+
+        waiter = self.loop.create_future()
+        self.drain_waiters.append(waiter)
+        await waiter
+
+    def is_closing(self) -> bool:
+        return self.transport.is_closing()
+
+    def close(self) -> None:
+        self.transport.close()
+
+    async def wait_closed(self) -> None:
+        await asyncio.shield(self.closed)
+
+
+class BatchWriter:
+    """ Writes directly while the transport has room and accumulates
+    the chunks while a drain is pending, the accumulated chunks are
+    written at once with writelines() when the drain completes. """
+
+    __slots__ = (
+        "writer", "sock", "high_water", "limit", "chunks", "size", "drain",
+    )
+
+    def __init__(
+        self, writer: ProxyProtocol, high_water: int, limit: int,
+    ):
+        self.writer = writer
+        self.sock: Optional[socket.socket] = writer.get_extra_info("socket")
+        self.high_water = high_water
+        self.limit = limit
+        self.chunks: List[ChunkType] = []
+        self.size = 0
+        self.drain: Optional["asyncio.Future[None]"] = None
+
+    @property
+    def released(self) -> bool:
+        """ True when neither the batch nor the transport holds
+        references to the written chunks. """
+        return (
+            not self.chunks and
+            not self.writer.transport.get_write_buffer_size()
+        )
+
+    async def write(self, data: ChunkType) -> None:
+        if self.drain is None:
+            self.writer.write(data)
+            self._schedule_drain()
+            return
+
+        self.chunks.append(data)
+        self.size += len(data)
+
+        if self.size >= self.limit:
+            await asyncio.shield(self.drain)
+
+    def _schedule_drain(self) -> None:
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() <= self.high_water:
+            return
+
+        self.drain = asyncio.ensure_future(self.writer.drain())
+        self.drain.add_done_callback(self._on_drained)
+
+    def _on_drained(self, future: "asyncio.Future[None]") -> None:
+        self.drain = None
+
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        self.flush()
+        self._schedule_drain()
+
+    def flush(self) -> None:
+        if not self.chunks or self.writer.is_closing():
+            return
+
+        sock_set_cork(self.sock, True)
+        try:
+            self.writer.writelines(self.chunks)
+        finally:
+            sock_set_cork(self.sock, False)
+
+        self.chunks = []
+        self.size = 0
+
+    def close(self) -> None:
+        if self.drain is not None:
+            self.drain.cancel()
+        self.flush()
+
+
 class TCPProxy:
     DEFAULT_TIMEOUT = 30
 
     __slots__ = (
-        "proxy_port", "clients", "server", "proxy_host",
+        "proxy_port", "clients", "server", "proxy_host", "socket",
         "target_port", "target_host", "listen_host", "read_delay",
         "write_delay", "read_processor", "write_processor", "buffered",
     )
@@ -116,17 +488,27 @@ class TCPProxy:
         self.target_port = target_port
         self.target_host = target_host
         self.proxy_host = listen_host
-        self.proxy_port = unused_port()
+        # Bind the listening socket right away, so the port is really
+        # held by the proxy instead of being probed by unused_port()
+        self.socket = self._bind_socket(0)
+        self.proxy_port = self.socket.getsockname()[1]
         self.read_delay: TimeoutType = 0
         self.write_delay: TimeoutType = 0
         self.buffered = buffered
 
-        self.clients: Set[TCPProxyClient] = set()
+        self.clients: "weakref.WeakSet[TCPProxyClient]" = weakref.WeakSet()
         self.server: Optional[asyncio.AbstractServer] = None
 
         self.read_processor: Optional[ProxyProcessorType] = None
         self.write_processor: Optional[ProxyProcessorType] = None
 
+    def __del__(self) -> None:
+        # The socket is bound in __init__, so it would leak when the proxy
+        # is never started or closed
+        sock = getattr(self, "socket", None)
+        if sock is not None:
+            sock.close()
+
     def __repr__(self) -> str:
         return "<{}[{:x}]: tcp://{}:{} => tcp://{}:{}>".format(
             self.__class__.__name__, id(self),
@@ -134,15 +516,41 @@ class TCPProxy:
             self.target_host, self.target_port,
         )
 
+    def _bind_socket(self, port: int) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.proxy_host else socket.AF_INET
+        # The transports set TCP_NODELAY only on sockets created with
+        # the explicit TCP protocol
+        sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+
+        if os.name == "posix":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        try:
+            sock.bind((self.proxy_host, port))
+        except Exception:
+            sock.close()
+            raise
+
+        sock.setblocking(False)
+        return sock
+
     async def start(
         self, timeout: Optional[TimeoutType] = None,
     ) -> asyncio.AbstractServer:
         log.debug("Starting %r", self)
+
+        # The socket is closed when the proxy was closed before
+        if self.socket.fileno() < 0:
+            self.socket = self._bind_socket(self.proxy_port)
+
+        loop = asyncio.get_running_loop()
         server = await asyncio.wait_for(
-            asyncio.start_server(
-                self._handle_client,
-                host=self.proxy_host,
-                port=self.proxy_port,
+            loop.create_server(
+                partial(
+                    ProxyProtocol, TCPProxyClient.CHUNK_SIZE,
+                    self._handle_client,
+                ),
+                sock=self.socket,
             ), timeout=timeout,
         )
         self.server = server
@@ -171,10 +579,12 @@ class TCPProxy:
             await self.disconnect_all()
 
             if self.server is None:
+                self.socket.close()
                 return
 
             self.server.close()
             await self.server.wait_closed()
+            self.socket.close()
 
         await asyncio.wait_for(close(), timeout=timeout)
 
@@ -209,40 +619,54 @@ class TCPProxy:
                 client, read, write,
             )
 
-            client.read_processor = read        # type: ignore
-            client.write_processor = write      # type: ignore
+            client.read_processor = read
+            client.write_processor = write
 
         self.read_processor = read
         self.write_processor = write
 
-    def disconnect_all(self) -> asyncio.Future:
+    def disconnect_all(self) -> "asyncio.Future[None]":
         log.debug(
             "Disconnecting %s clients of %r", len(self.clients), self,
         )
-        return asyncio.ensure_future(
-            asyncio.gather(
-                *[client.close() for client in self.clients],
-                return_exceptions=True,
-            ),
+        # Snapshot the clients, they could be finalized while closing
+        return asyncio.ensure_future(self._close_clients(tuple(self.clients)))
+
+    @staticmethod
+    async def _close_clients(clients: Tuple["TCPProxyClient", ...]) -> None:
+        clients = tuple(
+            client for client in clients if not client.closing.done()
         )
 
-    async def _handle_client(
-        self, reader: asyncio.StreamReader,
-        writer: asyncio.StreamWriter,
-    ) -> None:
-        client = TCPProxyClient(reader, writer, buffered=self.buffered)
+        if not clients:
+            return
+
+        await aiomisc.cancel_tasks(
+            list(chain.from_iterable(client.tasks for client in clients)),
+        )
+
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+
+        def set_closed() -> None:
+            for client in clients:
+                if not client.closing.done():
+                    client.closing.set_result(True)
+            closed.set_result(True)
+
+        loop.call_soon(set_closed)
+        await closed
+
+    async def _handle_client(self, connection: ProxyProtocol) -> None:
+        client = TCPProxyClient(connection, buffered=self.buffered)
         self.clients.add(client)
 
         client.read_delay.timeout = self.read_delay
         client.write_delay.timeout = self.write_delay
-        client.read_processor = self.read_processor     # type: ignore
-        client.write_processor = self.write_processor   # type: ignore
+        client.read_processor = self.read_processor
+        client.write_processor = self.write_processor
 
-        await client.connect(self.target_host, self.target_port)
-
-        client.closing.add_done_callback(
-            lambda _: self.clients.remove(client),
-        )
+        await client.serve(self.target_host, self.target_port)
 
     @contextmanager
     def slowdown(
@@ -260,13 +684,17 @@ class TCPProxy:
 
 
 class TCPProxyClient:
+    CHUNK_SIZE = 256 * 1024
+    MIN_CHUNK_SIZE = 16 * 1024
+    HIGH_WATER = 256 * 1024
+    LOW_WATER = 64 * 1024
+    UNBUFFERED_HIGH_WATER = 16 * 1024
+
     __slots__ = (
-        "client_reader", "client_writer",
-        "server_reader", "server_writer",
-        "chunk_size", "tasks", "loop",
+        "client", "server", "chunk_size", "read_size", "tasks", "loop",
         "read_delay", "write_delay", "closing",
-        "__processors", "__client_repr", "__server_repr",
-        "buffered",
+        "_read_proc", "_write_proc", "__client_repr", "__server_repr",
+        "buffered", "high_water", "__weakref__",
     )
 
     @staticmethod
@@ -274,54 +702,106 @@ class TCPProxyClient:
         return body
 
     def __init__(
-        self, client_reader: asyncio.StreamReader,
-        client_writer: asyncio.StreamWriter,
-        chunk_size: int = 64 * 1024, buffered: bool = False,
+        self, client_reader: Union[ProxyProtocol, asyncio.StreamReader],
+        client_writer: Optional[asyncio.StreamWriter] = None,
+        chunk_size: int = CHUNK_SIZE, buffered: bool = False,
     ):
 
-        self.loop = asyncio.get_event_loop()
-        self.client_reader: asyncio.StreamReader = client_reader
-        self.client_writer: asyncio.StreamWriter = client_writer
+        client = client_reader
+        if isinstance(client, asyncio.StreamReader):
+            if client_writer is None:
+                raise TypeError("client_writer is required for the reader")
+
+            warnings.warn(
+                "Passing a StreamReader and StreamWriter pair to "
+                "TCPProxyClient is deprecated, pass a ProxyProtocol instead",
+                DeprecationWarning, stacklevel=2,
+            )
+            client = ProxyProtocol.from_streams(
+                client, client_writer, chunk_size,
+            )
 
-        self.server_reader: Optional[asyncio.StreamReader] = None
-        self.server_writer: Optional[asyncio.StreamWriter] = None
+        self.loop = asyncio.get_running_loop()
+        self.client: ProxyProtocol = client
+        self.server: Optional[ProxyProtocol] = None
 
-        self.tasks: Iterable[asyncio.Task] = ()
+        self.tasks: Tuple["asyncio.Task[Any]", ...] = ()
         self.chunk_size = chunk_size  # type: int
+        self.read_size = min(self.MIN_CHUNK_SIZE, chunk_size)  # type: int
         self.read_delay = Delay()
         self.write_delay = Delay()
 
-        self.closing: asyncio.Future = self.loop.create_future()
-        self.__processors: Dict[str, ProxyProcessorType] = {
-            "read": self._blank_processor, "write": self._blank_processor,
-        }
+        self.closing: "asyncio.Future[bool]" = self.loop.create_future()
+        # None stands for the blank processor, so the pipe can skip
+        # the processor call entirely
+        self._read_proc: Optional[ProxyProcessorType] = None
+        self._write_proc: Optional[ProxyProcessorType] = None
 
         self.buffered = bool(buffered)
+        self.high_water = (
+            self.HIGH_WATER if self.buffered else self.UNBUFFERED_HIGH_WATER
+        )
 
         self.__client_repr = ""
         self.__server_repr = ""
 
     @property
     def read_processor(self) -> ProxyProcessorType:
-        return self.__processors["read"]
+        return self._read_proc or self._blank_processor
 
     @read_processor.setter
     def read_processor(self, value: Optional[ProxyProcessorType]) -> None:
-        if value is None:
-            self.__processors["read"] = self._blank_processor
+        if value is None or value is self._blank_processor:
+            self._read_proc = None
             return
-        self.__processors["read"] = aiomisc.awaitable(value)
+        if asyncio.iscoroutinefunction(value):
+            self._read_proc = value
+            return
+        self._read_proc = aiomisc.awaitable(value)
 
     @property
     def write_processor(self) -> ProxyProcessorType:
-        return self.__processors["write"]
+        return self._write_proc or self._blank_processor
 
     @write_processor.setter
     def write_processor(self, value: Optional[ProxyProcessorType]) -> None:
-        if value is None:
-            self.__processors["write"] = self._blank_processor
+        if value is None or value is self._blank_processor:
+            self._write_proc = None
+            return
+        if asyncio.iscoroutinefunction(value):
+            self._write_proc = value
             return
-        self.__processors["write"] = aiomisc.awaitable(value)
+        self._write_proc = aiomisc.awaitable(value)
+
+    @staticmethod
+    def _deprecated_alias(name: str) -> None:
+        warnings.warn(
+            "TCPProxyClient.{} is deprecated, the connection is handled "
+            "by the ProxyProtocol in TCPProxyClient.{}".format(
+                name, name.split("_")[0],
+            ),
+            DeprecationWarning, stacklevel=3,
+        )
+
+    @property
+    def client_reader(self) -> ProxyProtocol:
+        self._deprecated_alias("client_reader")
+        return self.client
+
+    @property
+    def client_writer(self) -> ProxyProtocol:
+        self._deprecated_alias("client_writer")
+        return self.client
+
+    @property
+    def server_reader(self) -> Optional[ProxyProtocol]:
+        self._deprecated_alias("server_reader")
+        return self.server
+
+    @property
+    def server_writer(self) -> Optional[ProxyProtocol]:
+        self._deprecated_alias("server_writer")
+        return self.server
 
     def __repr__(self) -> str:
         return "<{}[{:x}]: {} => {}>".format(
@@ -330,71 +810,135 @@ class TCPProxyClient:
         )
 
     @staticmethod
-    async def _close_writer(writer: asyncio.StreamWriter) -> None:
+    async def _close_writer(writer: ProxyProtocol) -> None:
         writer.close()
         await writer.wait_closed()
 
+    def _adapt_read_size(self, read_size: int, received: int) -> int:
+        if received >= read_size:
+            return min(read_size * 2, self.chunk_size)
+        if received < read_size // 4:
+            return max(read_size // 2, self.read_size)
+        return read_size
+
     async def pipe(
-        self, reader: asyncio.StreamReader,
-        writer: asyncio.StreamWriter,
+        self, reader: ProxyProtocol,
+        writer: ProxyProtocol,
         processor: str,
         delay: Delay,
     ) -> None:
-        try:
-            while not reader.at_eof():
-                chunk = await reader.read(self.chunk_size)
-
-                if not chunk:
-                    break
+        # Each direction adapts its own read size: grow while the reads
+        # fill the whole buffer, shrink when they come back mostly empty.
+        read_size = self.read_size
+        is_read = processor == "read"
+        batch = BatchWriter(writer, self.high_water, self.chunk_size * 4)
+
+        # Bind everything used per chunk to locals. Processors are still
+        # read from the slots on every chunk, so they can be replaced
+        # while the connection is alive.
+        pool = BUFFER_POOL
+        read = reader.read
+        adapt_read_size = self._adapt_read_size
+        batch_write = batch.write
 
-                if delay.timeout > 0:
-                    log.debug(
-                        "%r sleeping %.3f seconds on %s",
-                        self, delay.timeout, processor,
+        try:
+            with pool.reader():
+                while True:
+                    buffer, size = await read(read_size)
+
+                    if buffer is None:
+                        break
+
+                    read_size = adapt_read_size(read_size, size)
+                    chunk = memoryview(buffer)[:size]
+
+                    # noinspection PyProtectedMember
+                    timeout = delay._timeout
+                    if timeout:
+                        log.debug(
+                            "%r sleeping %.3f seconds on %s",
+                            self, timeout, processor,
+                        )
+
+                        await delay.wait()
+
+                    # The pooled buffer is written as is when there is no
+                    # processor, otherwise the processor is given its own
+                    # bytes object and the result is made immutable
+                    handler = (
+                        self._read_proc if is_read else self._write_proc
                     )
-
-                    await delay.wait()
-
-                writer.write(await self.__processors[processor](chunk))
-
-                if not self.buffered:
-                    await writer.drain()
+                    data: ChunkType
+                    if handler is None:
+                        data = chunk
+                    else:
+                        data = bytes(await handler(bytes(chunk)))
+
+                    await batch_write(data)
+
+                    # The batch or the transport may keep a reference to
+                    # the written chunk, so the buffer can't be reused
+                    if data is not chunk or batch.released:
+                        pool.release(buffer)
         finally:
+            batch.close()
             await self._close_writer(writer)
 
-    async def connect(self, target_host: str, target_port: int) -> None:
+    def _set_write_limits(self, writer: ProxyProtocol) -> None:
+        writer.transport.set_write_buffer_limits(
+            high=self.high_water,
+            low=min(self.LOW_WATER, self.high_water // 4),
+        )
+
+    async def _establish(self, target_host: str, target_port: int) -> None:
         log.debug("Establishing connection for %r", self)
 
-        self.server_reader, self.server_writer = await asyncio.open_connection(
+        _, self.server = await self.loop.create_connection(
+            partial(ProxyProtocol, self.chunk_size),
             host=target_host, port=target_port,
         )
 
+        for writer in (self.client, self.server):
+            self._set_write_limits(writer)
+
         self.__client_repr = ":".join(
-            map(str, self.client_writer.get_extra_info("peername")[:2]),
+            map(str, self.client.get_extra_info("peername")[:2]),
         )
         self.__server_repr = ":".join(
-            map(str, self.server_writer.get_extra_info("peername")[:2]),
+            map(str, self.server.get_extra_info("peername")[:2]),
         )
 
+    def _create_write_pipe(self) -> "asyncio.Task[None]":
+        assert self.server is not None
+        return self.loop.create_task(
+            self.pipe(self.server, self.client, "write", self.write_delay),
+        )
+
+    async def connect(self, target_host: str, target_port: int) -> None:
+        await self._establish(target_host, target_port)
+        assert self.server is not None
+
         self.tasks = (
+            self._create_write_pipe(),
             self.loop.create_task(
-                self.pipe(
-                    self.server_reader,
-                    self.client_writer,
-                    "write",
-                    self.write_delay,
-                ),
-            ),
-            self.loop.create_task(
-                self.pipe(
-                    self.client_reader,
-                    self.server_writer,
-                    "read",
-                    self.read_delay,
-                ),
+                self.pipe(self.client, self.server, "read", self.read_delay),
             ),
         )
 
+    async def serve(self, target_host: str, target_port: int) -> None:
+        """ Same as connect() but the client to server direction is
+        proxied by the current task until it's finished, so only the
+        opposite direction needs a task of its own. """
+
+        await self._establish(target_host, target_port)
+        assert self.server is not None
+
+        current_task = asyncio.current_task()
+        assert current_task is not None
+
+        self.tasks = (self._create_write_pipe(), current_task)
+        await self.pipe(self.client, self.server, "read", self.read_delay)
+
     async def close(self) -> None:
         log.debug("Closing %r", self)
         if self.closing.done():
@@ -412,11 +956,25 @@ def unused_port(*args: Any) -> int:
     return port
 
 
+class _EventLoopGetter:
+    """ Lightweight replacement of the MagicMock for
+    asyncio.get_event_loop, it just counts calls and delegates them
+    to the side_effect. """
+
+    __slots__ = "side_effect", "calls"
+
+    def __init__(self, side_effect: Callable[..., Any]):
+        self.side_effect = side_effect
+        self.calls = 0
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        self.calls += 1
+        return self.side_effect(*args, **kwargs)
+
+
 @contextmanager
-def mock_get_event_loop() -> Generator[Any, MagicMock, None]:
-    loop_getter = get_event_loop
-    getter_mock = MagicMock(asyncio.get_event_loop)
-    getter_mock.side_effect = loop_getter
+def mock_get_event_loop() -> Generator[_EventLoopGetter, None, None]:
+    getter_mock = _EventLoopGetter(get_event_loop)
 
     try:
         asyncio.get_event_loop = getter_mock
@@ -525,6 +1083,20 @@ def localhost() -> str:
         (socket.AF_INET, "127.0.0.1"),
         (socket.AF_INET6, "::1"),
     )
+
+    # Resolving localhost is cheaper than binding a socket per family
+    with suppress(socket.gaierror):
+        families = {
+            family for family, *_ in socket.getaddrinfo(
+                "localhost", 0, type=socket.SOCK_STREAM,
+            )
+        }
+        for family, addr in params:
+            if family == socket.AF_INET6 and not socket.has_ipv6:
+                continue
+            if family in families:
+                return addr
+
     for family, addr in params:
         with socket.socket(family, socket.SOCK_STREAM) as sock:
             try:
@@ -577,14 +1149,30 @@ def pytest_pyfunc_call(pyfuncitem):  # type: ignore
         for arg in pyfuncitem._fixtureinfo.argnames
     }
 
+    # The default wrapper adds nothing to a coroutine function
+    if func_wraper is aiomisc.awaitable:
+        test_func = pyfuncitem.obj
+    else:
+        test_func = func_wraper(pyfuncitem.obj)
+
     @wraps(pyfuncitem.obj)
     async def func() -> Any:
         return await asyncio.wait_for(
-            func_wraper(pyfuncitem.obj)(**kwargs),
+            test_func(**kwargs),
             timeout=aiomisc_test_timeout,
         )
 
-    event_loop.run_until_complete(func())
+    if not pyfuncitem.get_closest_marker("forbid_get_event_loop"):
+        event_loop.run_until_complete(func())
+        return True
+
+    # Only the test itself is checked, aiomisc calls get_event_loop
+    # when the services are started and stopped
+    with mock_get_event_loop() as event_loop_getter_mock:
+        event_loop_getter_mock.side_effect = partial(
+            pytest.fail, "get_event_loop is forbidden",
+        )
+        event_loop.run_until_complete(func())
 
     return True
 
@@ -640,7 +1228,6 @@ def event_loop(
     )
 
     get_marker = request.node.get_closest_marker
-    forbid_loop_getter_marker = get_marker("forbid_get_event_loop")
     catch_unhandled_marker = get_marker("catch_loop_exceptions")
 
     exceptions: List[Dict[str, Any]] = []
@@ -668,12 +1255,7 @@ def event_loop(
             LOG_LEVEL.set(logging.getLogger().getEffectiveLevel())
 
         try:
-            with mock_get_event_loop() as event_loop_getter_mock:
-                if forbid_loop_getter_marker:
-                    event_loop_getter_mock.side_effect = partial(
-                        pytest.fail, "get_event_loop is forbidden",
-                    )
-                yield loop
+            yield loop
         finally:
             if exceptions:
                 logging.error(
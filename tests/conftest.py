@@ -0,0 +1,36 @@
+import asyncio
+from functools import partial
+
+import pytest
+
+from aiomisc_pytest import ProxyProtocol
+
+
+@pytest.fixture
+async def peer(request, localhost):
+    """ ProxyProtocol connected to a stream server, yields the protocol
+    and the server side reader and writer. The buffer size of the
+    protocol might be passed as an indirect parameter. """
+
+    buffer_size = getattr(request, "param", 64 * 1024)
+    connections: asyncio.Queue = asyncio.Queue()
+
+    async def handler(reader, writer):
+        await connections.put((reader, writer))
+
+    server = await asyncio.start_server(handler, host=localhost, port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_connection(
+        partial(ProxyProtocol, buffer_size), host=localhost, port=port,
+    )
+    reader, writer = await connections.get()
+
+    try:
+        yield protocol, reader, writer
+    finally:
+        protocol.close()
+        writer.close()
+        server.close()
+        await server.wait_closed()
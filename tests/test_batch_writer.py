@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from aiomisc_pytest import BatchWriter
+
+
+CHUNK_SIZE = 8 * 1024
+HIGH_WATER = 16 * 1024
+
+
+def make_chunk(index: int) -> bytes:
+    return index.to_bytes(4, "big") * (CHUNK_SIZE // 4)
+
+
+@pytest.fixture
+def batch_peer(peer):
+    protocol, reader, _ = peer
+    protocol.transport.set_write_buffer_limits(
+        high=HIGH_WATER, low=HIGH_WATER // 4,
+    )
+    return protocol, reader
+
+
+async def fill(batch: BatchWriter) -> list:
+    """ Writes until the peer stops reading and a drain is pending """
+    sent = []
+    while batch.drain is None:
+        chunk = make_chunk(len(sent))
+        await batch.write(chunk)
+        sent.append(chunk)
+    return sent
+
+
+async def test_batch_writer_order_and_limit(batch_peer):
+    protocol, reader = batch_peer
+    batch = BatchWriter(protocol, HIGH_WATER, limit=CHUNK_SIZE * 4)
+
+    sent = await fill(batch)
+
+    # Queued while the drain is pending, below the limit
+    for _ in range(3):
+        chunk = make_chunk(len(sent))
+        await batch.write(chunk)
+        sent.append(chunk)
+
+    assert batch.chunks == sent[-3:]
+    assert not batch.released
+
+    # Reaching the limit blocks the writer until the drain completes
+    chunk = make_chunk(len(sent))
+    blocked = asyncio.ensure_future(batch.write(chunk))
+    sent.append(chunk)
+
+    await asyncio.sleep(0.1)
+    assert not blocked.done()
+
+    payload = b"".join(sent)
+    received = await asyncio.wait_for(
+        reader.readexactly(len(payload)), timeout=5,
+    )
+    await asyncio.wait_for(blocked, timeout=1)
+
+    assert received == payload
+
+
+async def test_batch_writer_close_flushes(batch_peer):
+    protocol, reader = batch_peer
+    batch = BatchWriter(protocol, HIGH_WATER, limit=CHUNK_SIZE * 4)
+
+    sent = await fill(batch)
+    chunk = make_chunk(len(sent))
+    await batch.write(chunk)
+    sent.append(chunk)
+    assert batch.chunks
+
+    batch.close()
+    assert not batch.chunks
+    protocol.close()
+
+    payload = b"".join(sent)
+    received = await asyncio.wait_for(reader.read(), timeout=5)
+    assert received == payload
@@ -0,0 +1,57 @@
+from aiomisc_pytest import BufferPool
+
+
+def test_acquire_size_class():
+    pool = BufferPool()
+
+    assert len(pool.acquire(1)) == 1
+    assert len(pool.acquire(16 * 1024)) == 16 * 1024
+    assert len(pool.acquire(16 * 1024 + 1)) == 32 * 1024
+
+
+def test_release_idle_cap():
+    pool = BufferPool()
+
+    # No active readers, nothing is kept
+    pool.release(bytearray(1024))
+    assert pool.idle == 0
+
+    with pool.reader(), pool.reader():
+        first, second, third = (bytearray(1024) for _ in range(3))
+
+        for buffer in (first, second, third):
+            pool.release(buffer)
+
+        # Held no more than the active readers
+        assert pool.idle == 2
+
+        # Buffers out of the size classes are not pooled
+        assert pool.acquire(1024) is second
+        pool.release(bytearray(1000))
+        assert pool.idle == 1
+
+        # Another size class is never returned
+        assert len(pool.acquire(2048)) == 2048
+        assert pool.acquire(1024) is first
+        assert pool.idle == 0
+
+
+def test_reader_trim():
+    pool = BufferPool()
+
+    with pool.reader():
+        with pool.reader():
+            small, large = bytearray(1024), bytearray(4096)
+            pool.release(small)
+            pool.release(large)
+            assert pool.idle == 2
+
+        # The largest idle buffer is dropped first
+        assert pool.idle == 1
+        assert pool.acquire(1024) is small
+        assert pool.acquire(4096) is not large
+
+        pool.release(small)
+
+    assert pool.idle == 0
+    assert not pool.buffers
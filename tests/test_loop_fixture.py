@@ -6,7 +6,7 @@ from typing import Callable
 import pytest
 
 from aiomisc import Service
-from aiomisc_pytest import PortSocket
+from aiomisc_pytest import PortSocket, _EventLoopGetter
 
 
 class _TestService(Service):
@@ -78,3 +78,19 @@ def test_aiomisc_socket_factory(
     assert result.port > 0
     assert result.socket.family == socket.AF_INET
     assert result.socket.type == socket.SOCK_DGRAM
+
+
+async def test_get_event_loop_not_mocked():
+    assert asyncio.get_event_loop is asyncio.events.get_event_loop
+
+
+@pytest.mark.forbid_get_event_loop
+async def test_get_event_loop_forbidden():
+    getter = asyncio.get_event_loop
+    assert isinstance(getter, _EventLoopGetter)
+
+    calls = getter.calls
+    with pytest.raises(pytest.fail.Exception):
+        asyncio.get_event_loop()
+
+    assert getter.calls == calls + 1
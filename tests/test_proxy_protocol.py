@@ -0,0 +1,90 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from aiomisc_pytest import ProxyProtocol
+
+
+BUFFER_SIZE = 64 * 1024
+
+
+async def read_all(protocol: ProxyProtocol, limit: int) -> bytes:
+    result = bytearray()
+    while True:
+        buffer, size = await protocol.read(limit)
+        if buffer is None:
+            return bytes(result)
+        result.extend(buffer[:size])
+
+
+async def test_read_eof(peer):
+    protocol, _, writer = peer
+
+    writer.write(b"Hello world")
+    writer.write_eof()
+
+    data = await asyncio.wait_for(read_all(protocol, BUFFER_SIZE), timeout=5)
+    assert data == b"Hello world"
+    assert protocol.eof
+
+    # Every read after EOF returns nothing
+    assert await protocol.read(BUFFER_SIZE) == (None, 0)
+
+
+async def test_read_pause_resume(peer):
+    protocol, _, writer = peer
+    limit = 1024
+    payload = bytes(range(256)) * 256
+
+    # Wait until the first limited read fills the buffer up to the limit
+    writer.write(payload)
+    buffer, size = await asyncio.wait_for(protocol.read(limit), timeout=5)
+    received = bytearray(buffer[:size])
+
+    while not protocol.reading_paused:
+        await asyncio.sleep(0.01)
+
+    assert protocol.size == limit
+
+    writer.write_eof()
+    received.extend(
+        await asyncio.wait_for(read_all(protocol, limit), timeout=5),
+    )
+
+    assert received == payload
+    assert not protocol.reading_paused
+
+
+async def test_connection_lost(peer):
+    protocol, _, writer = peer
+
+    # Reset the connection instead of closing it gracefully
+    sock = writer.get_extra_info("socket")
+    sock.setsockopt(
+        socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0),
+    )
+    writer.transport.abort()
+
+    with pytest.raises(ConnectionResetError):
+        await asyncio.wait_for(protocol.read(BUFFER_SIZE), timeout=5)
+
+    await asyncio.wait_for(protocol.wait_closed(), timeout=5)
+
+    with pytest.raises(ConnectionResetError):
+        await protocol.drain()
+
+
+async def test_drain_pause_resume(peer):
+    protocol, _, _ = peer
+
+    protocol.pause_writing()
+    drain = asyncio.ensure_future(protocol.drain())
+
+    await asyncio.sleep(0.01)
+    assert not drain.done()
+
+    protocol.resume_writing()
+    await asyncio.wait_for(drain, timeout=1)
+    assert not protocol.writing_paused
@@ -1,10 +1,14 @@
 import asyncio
+import gc
 import hashlib
+import socket
 import time
+import warnings
 
 import pytest
 
 import aiomisc
+from aiomisc_pytest import Delay, TCPProxy, TCPProxyClient
 
 
 class HashServer(aiomisc.service.TCPServer):
@@ -106,3 +110,275 @@ async def test_proxy_client_with_processor(proxy):
     hash = await asyncio.wait_for(reader.read(16), timeout=2)
 
     assert hash == hashlib.md5(processed_request).digest()[::-1]
+
+
+async def test_proxy_client_with_async_processor(proxy):
+    async def reverse(chunk: bytes) -> bytes:
+        return chunk[::-1]
+
+    proxy.set_content_processors(None, reverse)
+
+    reader, writer = await proxy.create_client()
+    payload = b"Hello world"
+
+    writer.write(payload)
+    hash = await asyncio.wait_for(reader.read(16), timeout=2)
+
+    assert hash == hashlib.md5(payload).digest()[::-1]
+
+
+async def test_delay_wakeup():
+    delay = Delay()
+    delay.timeout = 30
+
+    waiter = asyncio.ensure_future(delay.wait())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    delay.timeout = 0
+    await asyncio.wait_for(waiter, timeout=1)
+
+
+async def test_proxy_client_bulk(tcp_proxy, localhost):
+    async def echo(reader, writer):
+        chunk = await reader.read(65534)
+        while chunk:
+            writer.write(chunk)
+            await writer.drain()
+            chunk = await reader.read(65534)
+
+        writer.close()
+        await writer.wait_closed()
+
+    server = await asyncio.start_server(echo, host=localhost, port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    payload = bytes(range(256)) * 16 * 1024
+
+    try:
+        async with tcp_proxy(localhost, port) as proxy:
+            reader, writer = await proxy.create_client()
+
+            writer.write(payload)
+            sender = asyncio.ensure_future(writer.drain())
+            response = await asyncio.wait_for(
+                reader.readexactly(len(payload)), timeout=5,
+            )
+            await sender
+
+            assert response == payload
+
+            writer.close()
+            await writer.wait_closed()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_proxy_client_slow_reader(tcp_proxy, localhost):
+    payload = b"".join(i.to_bytes(4, "big") for i in range(1 << 20))
+    received = bytearray()
+    done = asyncio.Event()
+
+    async def slow_reader(reader, writer):
+        chunk = await reader.read(65536)
+        while chunk:
+            received.extend(chunk)
+            await asyncio.sleep(0.005)
+            chunk = await reader.read(65536)
+
+        writer.close()
+        done.set()
+
+    server = await asyncio.start_server(slow_reader, host=localhost, port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    try:
+        async with tcp_proxy(localhost, port) as proxy:
+            reader, writer = await proxy.create_client()
+            writer.write(payload)
+            await asyncio.wait_for(writer.drain(), timeout=10)
+            writer.write_eof()
+
+            assert await asyncio.wait_for(reader.read(), timeout=10) == b""
+            await asyncio.wait_for(done.wait(), timeout=10)
+            assert received == payload
+
+            writer.close()
+            await writer.wait_closed()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_proxy_client_buffered_latency(tcp_proxy, localhost):
+    async def handler(reader, writer):
+        request = await reader.read(64)
+        while request:
+            # Two small writes per response, apart enough to be proxied
+            # separately, is the worst case for Nagle's algorithm combined
+            # with the delayed ACK
+            writer.write(request[:1])
+            await asyncio.sleep(0.001)
+            writer.write(request[1:])
+            request = await reader.read(64)
+
+        writer.close()
+
+    server = await asyncio.start_server(handler, host=localhost, port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    try:
+        async with tcp_proxy(localhost, port, buffered=True) as proxy:
+            reader, writer = await proxy.create_client()
+
+            started = time.monotonic()
+            for _ in range(20):
+                writer.write(b"ping")
+                response = await asyncio.wait_for(
+                    reader.readexactly(4), timeout=1,
+                )
+                assert response == b"ping"
+
+            # Around 40ms per round trip when the small writes are delayed
+            assert time.monotonic() - started < 0.4
+
+            writer.close()
+            await writer.wait_closed()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_proxy_client_unreachable_target(tcp_proxy, localhost):
+    with socket.socket() as sock:
+        sock.bind((localhost, 0))
+        port = sock.getsockname()[1]
+
+    loop = asyncio.get_running_loop()
+    errors = []
+    handler = loop.get_exception_handler()
+    loop.set_exception_handler(lambda _, context: errors.append(context))
+
+    try:
+        async with tcp_proxy(localhost, port) as proxy:
+            reader, writer = await proxy.create_client()
+            assert await asyncio.wait_for(reader.read(), timeout=5) == b""
+
+            writer.close()
+            await writer.wait_closed()
+    finally:
+        loop.set_exception_handler(handler)
+
+    assert len(errors) == 1
+    assert isinstance(errors[0]["exception"], ConnectionRefusedError)
+
+
+async def test_proxy_client_from_streams(localhost, server_port):
+    clients = []
+
+    async def handler(reader, writer):
+        # Let the payload be buffered by the reader first
+        await reader._wait_for_data("test")
+
+        with pytest.warns(DeprecationWarning):
+            client = TCPProxyClient(reader, writer)
+
+        clients.append(client)
+        await client.serve(localhost, server_port)
+
+    server = await asyncio.start_server(handler, host=localhost, port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    try:
+        reader, writer = await asyncio.open_connection(localhost, port)
+        payload = b"Hello world"
+
+        writer.write(payload)
+        hash = await asyncio.wait_for(reader.readexactly(16), timeout=2)
+        assert hash == hashlib.md5(payload).digest()
+
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.wait_for(clients[0].close(), timeout=2)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_proxy_client_from_streams_connect(localhost, server_port):
+    clients = []
+
+    async def handler(reader, writer):
+        with pytest.warns(DeprecationWarning):
+            client = TCPProxyClient(
+                client_reader=reader, client_writer=writer,
+            )
+
+        clients.append(client)
+        # The handler returns, so the stream pair is referenced
+        # by the proxy client only
+        await client.connect(localhost, server_port)
+
+    server = await asyncio.start_server(handler, host=localhost, port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    try:
+        reader, writer = await asyncio.open_connection(localhost, port)
+        hasher = hashlib.md5()
+
+        for payload in (b"Hello", b"world"):
+            gc.collect()
+
+            writer.write(payload)
+            hasher.update(payload)
+            hash = await asyncio.wait_for(reader.readexactly(16), timeout=2)
+            assert hash == hasher.digest()
+
+        client = clients[0]
+        assert not client.client.is_closing()
+
+        with pytest.warns(DeprecationWarning):
+            assert client.client_reader is client.client
+        with pytest.warns(DeprecationWarning):
+            assert client.client_writer is client.client
+        with pytest.warns(DeprecationWarning):
+            assert client.server_reader is client.server
+        with pytest.warns(DeprecationWarning):
+            assert client.server_writer is client.server
+
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.wait_for(client.close(), timeout=2)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_proxy_not_started_socket_closed(localhost):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+
+        proxy = TCPProxy(localhost, 1)
+        del proxy
+        gc.collect()
+
+    assert not [w for w in caught if w.category is ResourceWarning]
+
+
+async def test_proxy_restart(proxy):
+    port = proxy.proxy_port
+
+    await proxy.close()
+    await proxy.start()
+    assert proxy.proxy_port == port
+
+    reader, writer = await proxy.create_client()
+    payload = b"Hello world"
+
+    writer.write(payload)
+    hash = await asyncio.wait_for(reader.readexactly(16), timeout=1)
+    assert hash == hashlib.md5(payload).digest()
+
+    writer.close()
+    await writer.wait_closed()